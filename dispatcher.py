@@ -0,0 +1,235 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# --------------------------
+# CONFIGURATION
+# --------------------------
+# WORKER_PROCESSES: number of worker processes; each loads its own EasyOCR model and
+#   browsers, so keep it small unless the host has the memory for it
+DEFAULT_WORKERS = 2
+# How often crashed workers are detected (seconds)
+MONITOR_INTERVAL = 1
+# Restart delay doubles after each crash, starting at RESTART_BACKOFF and capped at MAX_RESTART_BACKOFF
+RESTART_BACKOFF = 5
+MAX_RESTART_BACKOFF = 300
+# A worker crashing this many times in a row is given up on; running STABLE_UPTIME seconds resets the count
+MAX_RESTARTS = 5
+STABLE_UPTIME = 300
+
+CRASH_MESSAGE = "⚠️ The worker handling your session crashed, your browser session was lost. Please /login again."
+UNAVAILABLE_MESSAGE = "❌ The service is unavailable right now, please try again later."
+
+
+def _worker_entry(index, inbox, outbox):
+    """Process entry point; imports the worker lazily so the front end never loads Selenium or OCR"""
+    import worker
+    worker.main(index, inbox, outbox)
+
+
+class LocalTransport:
+    """
+    Queue based IPC between the front end and worker processes on this host.
+
+    Any object providing spawn/reset/send/receive can replace it, e.g. one backed
+    by a network broker so workers can run on other nodes.
+    """
+
+    def __init__(self, num_workers, context=None):
+        self.context = context or multiprocessing.get_context('spawn')
+        self.inboxes = [self.context.Queue() for _ in range(num_workers)]
+        self.outbox = self.context.Queue()
+
+    def spawn(self, index):
+        """Start worker `index` and return a handle with is_alive(), exitcode and join()"""
+        process = self.context.Process(target=_worker_entry,
+                                       args=(index, self.inboxes[index], self.outbox),
+                                       name=f"worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    def reset(self, index):
+        """
+        Replace a worker's inbox after a crash and return the jobs it never read.
+
+        Reads don't block: if the dead worker held the queue's read lock the rest is lost.
+        """
+        unread = []
+        old = self.inboxes[index]
+        self.inboxes[index] = self.context.Queue()
+        while True:
+            try:
+                unread.append(old.get_nowait())
+            except (queue.Empty, OSError, EOFError):
+                break
+        return unread
+
+    def send(self, index, job):
+        self.inboxes[index].put(job)
+
+    def receive(self, timeout=None):
+        try:
+            return self.outbox.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class WorkerPool:
+    """Dispatches bot jobs to worker processes, each owning its own drivers and OCR reader"""
+
+    def __init__(self, num_workers=None, transport=None, notify=None):
+        self.num_workers = num_workers or int(os.getenv('WORKER_PROCESSES', DEFAULT_WORKERS))
+        self.transport = transport or LocalTransport(self.num_workers)
+        self.notify = notify  # notify(user_id, text), tells users about jobs lost to a crash
+        self.workers = [None] * self.num_workers
+        self.started_at = [0.0] * self.num_workers
+        self.failures = [0] * self.num_workers
+        self.restart_at = [None] * self.num_workers  # Set while a crashed worker waits out its backoff
+        self.given_up = [False] * self.num_workers
+        self.pending = [{} for _ in range(self.num_workers)]  # Job id -> job, until a result arrives
+        self.session_users = [set() for _ in range(self.num_workers)]  # Users who may hold a browser
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        """Spawn all workers and the monitor/result threads"""
+        with self._lock:
+            for index in range(self.num_workers):
+                self._spawn(index)
+            self._running = True
+        threading.Thread(target=self._monitor, name="worker-monitor", daemon=True).start()
+        threading.Thread(target=self._collect, name="worker-results", daemon=True).start()
+        logger.info(f"Started {self.num_workers} worker(s)")
+
+    def worker_for(self, user_id):
+        """Sticky routing: a user always lands on the same worker, where their session lives"""
+        return zlib.crc32(str(user_id).encode()) % self.num_workers
+
+    def submit(self, kind, message):
+        """Queue a job built from a Telegram message on the user's worker"""
+        job = {
+            'id': next(self._job_ids),
+            'kind': kind,
+            'user_id': message.chat.id,
+            'message_id': message.message_id,
+            'text': message.text,
+        }
+        index = self.worker_for(job['user_id'])
+        with self._lock:
+            given_up = self.given_up[index]
+            if not given_up:
+                self._enqueue(index, job)
+        if given_up:
+            self._notify(job['user_id'], UNAVAILABLE_MESSAGE)
+
+    def _enqueue(self, index, job):
+        """Track and send a job; call with the lock held"""
+        if job['kind'] == 'logout':
+            self.session_users[index].discard(job['user_id'])
+        elif job['kind'] != 'input':
+            self.session_users[index].add(job['user_id'])
+        self.pending[index][job['id']] = job
+        self.transport.send(index, job)
+
+    def _spawn(self, index):
+        self.workers[index] = self.transport.spawn(index)
+        self.started_at[index] = time.monotonic()
+        self.restart_at[index] = None
+
+    def _notify(self, user_id, text):
+        if not self.notify:
+            return
+        try:
+            self.notify(user_id, text)
+        except Exception as e:
+            logger.error(f"Failed to notify {user_id}: {e}")
+
+    def _monitor(self):
+        """Restart workers that died, backing off on repeated crashes"""
+        while self._running:
+            time.sleep(MONITOR_INTERVAL)
+            if not self.check_workers():
+                return
+
+    def check_workers(self):
+        """One monitor pass; returns False once the pool is stopped"""
+        notifications = []
+        with self._lock:
+            if not self._running:
+                return False
+            for index, handle in enumerate(self.workers):
+                if self.given_up[index]:
+                    continue
+                if self.restart_at[index] is not None:
+                    if time.monotonic() >= self.restart_at[index]:
+                        logger.info(f"Restarting worker {index}")
+                        self._spawn(index)
+                    continue
+                if not handle.is_alive():
+                    notifications += self._handle_crash(index, handle)
+        # Telegram calls are slow, never make them while holding the lock submit() needs
+        for user_id, text in notifications:
+            self._notify(user_id, text)
+        return True
+
+    def _handle_crash(self, index, handle):
+        """
+        Requeue the crashed worker's unread jobs and schedule a restart; call with the lock held.
+
+        Returns the (user_id, text) notifications for the affected users.
+        """
+        if time.monotonic() - self.started_at[index] >= STABLE_UPTIME:
+            self.failures[index] = 0
+        self.failures[index] += 1
+
+        unread = [job for job in self.transport.reset(index) if job]  # Drop stop sentinels
+        unread_ids = {job['id'] for job in unread}
+        lost = [job for job_id, job in self.pending[index].items() if job_id not in unread_ids]
+        affected = self.session_users[index] | {job['user_id'] for job in lost}
+        self.session_users[index] = set()
+        self.pending[index] = {}
+
+        if self.failures[index] > MAX_RESTARTS:
+            logger.error(f"Worker {index} exited with code {handle.exitcode} after "
+                         f"{self.failures[index]} crashes in a row, giving up on it")
+            self.given_up[index] = True
+            affected |= {job['user_id'] for job in unread}
+            return [(user_id, UNAVAILABLE_MESSAGE) for user_id in affected]
+
+        delay = min(RESTART_BACKOFF * 2 ** (self.failures[index] - 1), MAX_RESTART_BACKOFF)
+        logger.warning(f"Worker {index} exited with code {handle.exitcode}, "
+                       f"restarting in {delay}s (crash #{self.failures[index]})")
+        self.restart_at[index] = time.monotonic() + delay
+        for job in unread:
+            self._enqueue(index, job)
+        return [(user_id, CRASH_MESSAGE) for user_id in affected]
+
+    def _collect(self):
+        """Track and log job results reported by workers"""
+        while self._running:
+            result = self.transport.receive(timeout=1)
+            if not result:
+                continue
+            with self._lock:
+                self.pending[result['worker']].pop(result['id'], None)
+            if result.get('error'):
+                logger.error(f"Worker {result['worker']} failed '{result['kind']}' "
+                             f"for {result['user_id']}: {result['error']}")
+
+    def stop(self):
+        """Ask workers to close their sessions and exit"""
+        with self._lock:
+            self._running = False
+            for index in range(self.num_workers):
+                self.transport.send(index, None)
+        for handle in self.workers:
+            if handle:
+                handle.join(timeout=10)
@@ -6,36 +6,35 @@ from io import BytesIO
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import NoSuchElementException
 import time
-from session_manager(headless) import session_manager
+from session_manager import session_manager
+from user_state import user_states
+from tracing import traced, trace_driver, trace_phase, trace_wait
 import json
 
-# Bot instance handling
-bot_instances = {}
-chat_ids = {}
-user_inputs = {}
-last_message_id = {}
-status_logs = {}
+# Bot instance handling, one UserState per chat (see user_state.py)
 
 
 def set_bot_instance(bot, chat_id):
-    global bot_instances, chat_ids
-    bot_instances[chat_id] = bot
-    chat_ids[chat_id] = chat_id
+    state = user_states.get_or_create(chat_id)
+    state.bot = bot
+    state.chat_id = chat_id
 
 
-def bot_log(message, user_id=None):
-    if user_id in bot_instances and user_id in chat_ids:
+def bot_log(message, user_id=None, keep=False):
+    """Show a status message, replacing the previous one; with keep=True it stays in the chat"""
+    state = user_states.get(user_id)
+    if state and state.bot:
         try:
             # Delete previous message if exists
-            if user_id in last_message_id:
+            if state.last_message_id is not None:
                 try:
-                    bot_instances[user_id].delete_message(chat_ids[user_id], last_message_id[user_id])
+                    state.bot.delete_message(state.chat_id, state.last_message_id)
                 except:
                     pass  # Ignore if message already deleted
 
             # Send new message and store its ID
-            msg = bot_instances[user_id].send_message(chat_ids[user_id], str(message))
-            last_message_id[user_id] = msg.message_id
+            msg = state.bot.send_message(state.chat_id, str(message))
+            state.last_message_id = None if keep else msg.message_id
         except Exception as e:
             print(f"Failed to send message to bot: {e}")
             print(message)
@@ -45,19 +44,21 @@ def bot_log(message, user_id=None):
 
 def clear_status(user_id):
     """Clear the status message for a user"""
-    if user_id in last_message_id:
+    state = user_states.get(user_id)
+    if state and state.last_message_id is not None:
         try:
-            bot_instances[user_id].delete_message(chat_ids[user_id], last_message_id[user_id])
+            state.bot.delete_message(state.chat_id, state.last_message_id)
         except:
             pass  # Ignore if message already deleted
-        del last_message_id[user_id]
+        state.last_message_id = None
 
 
 def bot_send_image(image_path, caption, user_id):
-    if user_id in bot_instances and user_id in chat_ids:
+    state = user_states.get(user_id)
+    if state and state.bot:
         try:
             with open(image_path, 'rb') as photo:
-                bot_instances[user_id].send_photo(chat_ids[user_id], photo, caption=caption)
+                state.bot.send_photo(state.chat_id, photo, caption=caption)
         except Exception as e:
             print(f"Failed to send image to bot: {e}")
     else:
@@ -65,20 +66,26 @@ def bot_send_image(image_path, caption, user_id):
 
 
 def bot_input(prompt, user_id=None):
-    if user_id in bot_instances and user_id in chat_ids:
-        bot_instances[user_id].send_message(chat_ids[user_id], prompt)
+    state = user_states.get(user_id)
+    if state and state.bot:
+        state.bot.send_message(state.chat_id, prompt)
         # Set the user as waiting for input
-        user_inputs[user_id] = None
+        state.input_value = None
+        state.waiting_input = True
         # Wait for input (with timeout)
         timeout = 60  # 60 seconds timeout
         start_time = time.time()
-        while user_inputs[user_id] is None:
-            if time.time() - start_time > timeout:
-                bot_log("⚠️ Input timeout. Please try again.", user_id)
-                return None
-            time.sleep(0.5)
-        response = user_inputs[user_id]
-        user_inputs[user_id] = None
+        try:
+            while state.waiting_input:
+                if time.time() - start_time > timeout:
+                    state.waiting_input = False
+                    bot_log("⚠️ Input timeout. Please try again.", user_id)
+                    return None
+                time.sleep(0.5)
+        finally:
+            trace_wait(user_id, time.time() - start_time)  # Kept apart from our own time in traces
+        response = state.input_value
+        state.input_value = None
         return response
     return input(prompt)
 
@@ -88,6 +95,7 @@ def bot_input(prompt, user_id=None):
 # --------------------------
 website_url = os.getenv('URL')
 max_retries = 3
+form_snapshot_dir = os.getenv('FORM_SNAPSHOT_DIR', 'form_snapshots')
 
 # XPaths (Pre-Login)
 XPATHS = {
@@ -108,8 +116,36 @@ POST_LOGIN_XPATHS = {
     "Page1_btn_path": "/html/body/form/div[4]/div/div/div/div/div/div/input",
     "Page2_verify_path": "/html/body/form/div[4]/div/div/div/div/div/div/span",
     "Page2_btn_path": "/html/body/form/div[4]/div/div/div/div/div/div[2]/div[2]/div/div/div/div/ul/input",
-    "Page3_btn_path": "/html/body/form/header/nav/div/div/ul/li[2]/a"
+    "Page3_btn_path": "/html/body/form/header/nav/div/div/ul/li[2]/a",
+    "value_input_path": "/html/body/form/div[4]/div/div/div/div/div/div/div[2]/div/div/div[15]/input",
+    "save_btn_path": "/html/body/form/div[4]/div/div/div/div/div/div/div[2]/div/div/div[19]/input"
+}
+
+# Applies a {label: {"id", "value"}} mapping in one round-trip and reports per-field results.
+# Fields that fail validation get their previous value back so a later save can't post them.
+FILL_FORM_SCRIPT = """
+const fields = arguments[0];
+const results = {};
+const setValue = (element, value) => {
+    element.value = value;
+    element.dispatchEvent(new Event('input', {bubbles: true}));
+    element.dispatchEvent(new Event('change', {bubbles: true}));
+};
+for (const [label, field] of Object.entries(fields)) {
+    const element = document.getElementById(field.id);
+    if (!element) { results[label] = 'not found'; continue; }
+    if (element.readOnly || element.disabled) { results[label] = 'read-only'; continue; }
+    const previous = element.value;
+    setValue(element, field.value);
+    if (!element.checkValidity()) {
+        results[label] = element.validationMessage || 'invalid';
+    } else {
+        results[label] = element.value === field.value ? 'ok' : 'rejected';
+    }
+    if (results[label] !== 'ok') { setValue(element, previous); }
 }
+return results;
+"""
 
 # Initialize components
 reader = easyocr.Reader(["en"])
@@ -175,14 +211,17 @@ def get_user_credentials(user_id):
     return username, password
 
 
+@traced('login')
 def handle_login_attempt(user_id):
     """Main login handler with automatic retries and manual fallback"""
     clear_status(user_id)  # Clear previous status
     session = session_manager.get_session(user_id)
     driver = session['driver']
+    trace_driver(user_id, driver)
     success = False
 
     # Get credentials
+    trace_phase(user_id, 'credentials')
     username, password = get_user_credentials(user_id)
     if not username or not password:
         bot_log("❌ Login failed: Invalid credentials", user_id)
@@ -199,6 +238,7 @@ def handle_login_attempt(user_id):
         return True
 
     # Before trying manual mode, check if credentials are valid
+    trace_phase(user_id, 'recheck_credentials')
     driver.get(website_url)
     time.sleep(2)
     enter_credentials(driver, username, password, user_id)
@@ -228,6 +268,7 @@ def handle_login_attempt(user_id):
 def automatic_login(driver, username, password, user_id):
     """Automatic login attempts with OCR"""
     bot_log(f"\n🌀 Attempting automatic login", user_id)
+    trace_phase(user_id, 'open_login_page')
     driver.get(website_url)
     time.sleep(2)
 
@@ -268,6 +309,7 @@ def automatic_login(driver, username, password, user_id):
 def manual_login(driver, username, password, user_id):
     """Manual login handler"""
     bot_log("\n📝 Starting manual login process...", user_id)
+    trace_phase(user_id, 'open_login_page')
     driver.get(website_url)
     time.sleep(2)
 
@@ -310,6 +352,7 @@ def manual_login(driver, username, password, user_id):
 # --------------------------
 def enter_credentials(driver, username, password, user_id):
     """Enter username and password"""
+    trace_phase(user_id, 'enter_credentials')
     try:
         driver.find_element(By.XPATH, XPATHS["username"]).send_keys(username)
         driver.find_element(By.XPATH, XPATHS["password"]).send_keys(password)
@@ -322,6 +365,7 @@ def enter_credentials(driver, username, password, user_id):
 
 def process_captcha(driver, user_id):
     """Automatic captcha processing"""
+    trace_phase(user_id, 'captcha_ocr')
     try:
         captcha_element = driver.find_element(By.XPATH, XPATHS["captcha_img"])
         captcha_url = captcha_element.get_attribute("src")
@@ -341,6 +385,7 @@ def process_captcha(driver, user_id):
 
 def process_captcha_manual(driver, user_id):
     """Manual captcha handling"""
+    trace_phase(user_id, 'captcha_manual')
     try:
         # Get and save captcha
         captcha_element = driver.find_element(By.XPATH, XPATHS["captcha_img"])
@@ -365,6 +410,7 @@ def process_captcha_manual(driver, user_id):
 
 def submit_login(driver, user_id):
     """Click login button"""
+    trace_phase(user_id, 'submit_login')
     try:
         driver.find_element(By.XPATH, XPATHS["login_button"]).click()
         bot_log("🔄 Submitting login...", user_id)
@@ -375,6 +421,7 @@ def submit_login(driver, user_id):
 
 def check_login_result(driver, user_id):
     """Check login success/failure with simple text content logging"""
+    trace_phase(user_id, 'check_login_result')
     try:
         error_element = driver.find_elements(By.XPATH, XPATHS["login_failure"])
         if error_element:
@@ -438,18 +485,78 @@ def post_login_click_button(driver, button_element, user_id):
     return False
 
 
+def load_form_snapshot(user_id):
+    """Load the {label: value} form snapshot from the user's last run"""
+    try:
+        with open(os.path.join(form_snapshot_dir, f"{user_id}.json"), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_form_snapshot(user_id, snapshot):
+    """Persist the user's {label: value} form snapshot, one compact file per user"""
+    os.makedirs(form_snapshot_dir, exist_ok=True)
+    path = os.path.join(form_snapshot_dir, f"{user_id}.json")
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot, f, separators=(',', ':'), ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def update_form_snapshot(user_id, updates):
+    """Record values we saved ourselves, so the next run only reports changes made elsewhere"""
+    snapshot = load_form_snapshot(user_id)
+    if snapshot is not None and updates:
+        snapshot.update(updates)
+        save_form_snapshot(user_id, snapshot)
+
+
+def diff_form_snapshot(previous, current):
+    """Return ({label: (old, new)} for changed or new fields, [labels that disappeared])"""
+    changed = {label: (previous.get(label), value) for label, value in current.items()
+               if label not in previous or previous[label] != value}
+    removed = [label for label in previous if label not in current]
+    return changed, removed
+
+
+def report_form_changes(fields, user_id):
+    """Send only the fields that changed since the user's last run, in one message that stays in the chat"""
+    if not fields:
+        # Most likely the wrong page; keep the last snapshot rather than reporting every field as removed
+        bot_log("⚠️ No form fields found", user_id)
+        return
+
+    previous = load_form_snapshot(user_id)
+    current = {label: field['value'] for label, field in fields.items()}
+    changed, removed = diff_form_snapshot(previous or {}, current)
+
+    if previous is None:
+        lines = [f"{'🔒' if fields[label]['readonly'] else '✏️'} {label}: {value}" for label, value in current.items()]
+        bot_log("📝 Form Data:\n" + "\n".join(lines), user_id, keep=True)
+    elif changed or removed:
+        lines = [f"🆕 {label}: {new}" if old is None else f"🔄 {label}: {old} → {new}"
+                 for label, (old, new) in changed.items()]
+        lines += [f"➖ {label}" for label in removed]
+        bot_log("📝 Changes since last run:\n" + "\n".join(lines), user_id, keep=True)
+    else:
+        bot_log("✅ No form changes since last run", user_id, keep=True)
+
+    save_form_snapshot(user_id, current)
+
+
 def extract_form_data(driver, user_id):
     """
-    Extracts and prints relevant information from the data entry form dynamically.
+    Extracts relevant information from the data entry form dynamically and reports
+    what changed since the user's last run.
 
+    Returns {label: {"id", "value", "readonly"}} for the fields shown.
     """
+    fields = {}
     try:
         bot_log("\n" + "=" * 40, user_id)
         bot_log("FORM INFORMATION".center(40), user_id)
         bot_log("=" * 40, user_id)
 
-        bot_log("\n📝 Form Data:", user_id)
-
         input_elements = driver.find_elements(By.TAG_NAME, "input")
 
         for element in input_elements:
@@ -464,19 +571,134 @@ def extract_form_data(driver, user_id):
                 continue
 
             label = label.replace("HomeContentPlaceHolder_txt", "")
+            fields[label] = {'id': field_id, 'value': value, 'readonly': bool(readonly)}
 
-            status = "🔒" if readonly else "✏️"
-            bot_log(f"{status} {label}: {value}", user_id)
+        report_form_changes(fields, user_id)
 
     except Exception as e:
         bot_log(f"❌ Error extracting form information: {str(e)}", user_id)
+    return fields
+
 
+def parse_field_values(text):
+    """Parse "Label: value" (or "Label = value") lines into a dict, splitting on the first separator"""
+    values = {}
+    for line in (text or "").splitlines():
+        positions = [index for index in (line.find(":"), line.find("=")) if index > 0]
+        if not positions:
+            continue
+        label, value = line[:min(positions)], line[min(positions) + 1:]
+        if label.strip():
+            values[label.strip()] = value.strip()
+    return values
 
-def post_login_operations(user_id):
-    """Execute actions after successful login"""
+
+def load_form_values(user_id):
+    """Load a batch field mapping for the user from form_values.json, keyed like credentials.json"""
+    try:
+        with open('form_values.json', 'r') as f:
+            return json.load(f).get(str(user_id)) or {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def fill_form_fields(driver, fields, values, user_id):
+    """
+    Applies a {label: value} mapping to the form in one execute_script call and saves.
+
+    Labels are matched case-insensitively against the labels (or ids) from extract_form_data.
+    Fields already holding the target value are left alone, and the save is skipped when
+    nothing needs to change.
+    Returns {label: result}, where result is "ok" for applied fields and "unchanged" for skipped ones.
+    If the save fails, applied fields are reported as "applied, not saved".
+    """
+    by_label = {}
+    for label, field in fields.items():
+        by_label[label.lower()] = (label, field)
+        by_label[field['id'].lower()] = (label, field)
+
+    results = {}
+    targets = {}
+    for requested, value in values.items():
+        match = by_label.get(requested.strip().lower())
+        if not match:
+            results[requested] = "unknown field"
+            continue
+        label, field = match
+        if field['value'] == str(value):
+            results[label] = "unchanged"
+            continue
+        targets[label] = {'id': field['id'], 'value': str(value)}
+
+    if targets:
+        results.update(driver.execute_script(FILL_FORM_SCRIPT, targets))
+
+    applied = [label for label, result in results.items() if result == "ok"]
+    icons = {"ok": "✅", "unchanged": "⏭️"}
+
+    def summary():
+        return "\n".join(f"{icons.get(result, '❌')} {label}: {result}" for label, result in results.items())
+
+    if applied:
+        try:
+            save_button = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["save_btn_path"])
+            saved = post_login_click_button(driver, save_button, user_id)
+        except NoSuchElementException:
+            saved = False
+        if not saved:
+            # The page holds the new values but the portal never got them
+            results.update({label: "applied, not saved" for label in applied})
+            bot_log(f"❌ Save button not found or not clickable, nothing saved:\n{summary()}", user_id)
+            return results
+        update_form_snapshot(user_id, {label: targets[label]['value'] for label in applied})
+        bot_log(f"✅ Saved {len(applied)} of {len(results)} field(s):\n{summary()}", user_id)
+    elif results and all(result == "unchanged" for result in results.values()):
+        bot_log(f"✅ Already up to date, save skipped:\n{summary()}", user_id)
+    else:
+        bot_log(f"⚠️ Nothing saved:\n{summary()}", user_id)
+    return results
+
+
+def open_data_entry_form(driver, user_id):
+    """Navigate from the landing page to the data entry form"""
+    Page1_btn = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["Page1_btn_path"])
+    button_text = Page1_btn.text.strip() or Page1_btn.get_attribute('value')
+    bot_log(f"🖱️ Found button: {button_text}", user_id)
+    if not post_login_click_button(driver, Page1_btn, user_id):
+        raise Exception(f"Failed to click '{button_text}' button")
+    time.sleep(2)
+
+    Page2_verify = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["Page2_verify_path"])
+    bot_log(f"📋 Found section: {Page2_verify.text}", user_id)
+
+    Page2_btn = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["Page2_btn_path"])
+    button_text = Page2_btn.text.strip() or Page2_btn.get_attribute('value')
+    bot_log(f"🖱️ Found button: {button_text}", user_id)
+    if not post_login_click_button(driver, Page2_btn, user_id):
+        raise Exception(f"Failed to click '{button_text}' button")
+    time.sleep(2)
+
+    Page3_btn = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["Page3_btn_path"])
+    button_text = Page3_btn.text.strip() or Page3_btn.get_attribute('value')
+    bot_log(f"🖱️ Found button: {button_text}", user_id)
+    if not post_login_click_button(driver, Page3_btn, user_id):
+        raise Exception(f"Failed to click '{button_text}' button")
+    time.sleep(2)
+
+
+@traced('operations')
+def post_login_operations(user_id, values=None):
+    """
+    Execute actions after successful login
+
+    With `values` (a {label: value} mapping, possibly empty) every field is filled in one batch,
+    asking the user for the whole mapping in a single message when it is empty.
+    Without it the single legacy input field is filled.
+    """
     clear_status(user_id)  # Clear previous status
     session = session_manager.get_session(user_id)
     driver = session['driver']
+    trace_driver(user_id, driver)
     bot_log("\n" + "=" * 40, user_id)
     bot_log("POST-LOGIN OPERATIONS".center(40), user_id)
     bot_log("=" * 40, user_id)
@@ -486,37 +708,36 @@ def post_login_operations(user_id):
             if os.path.exists(file):
                 os.remove(file)
 
-        Page1_btn = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["Page1_btn_path"])
-        button_text = Page1_btn.text.strip() or Page1_btn.get_attribute('value')
-        bot_log(f"🖱️ Found button: {button_text}", user_id)
-        if not post_login_click_button(driver, Page1_btn, user_id):
-            raise Exception(f"Failed to click '{button_text}' button")
-        time.sleep(2)
-
-        Page2_verify = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["Page2_verify_path"])
-        bot_log(f"📋 Found section: {Page2_verify.text}", user_id)
+        trace_phase(user_id, 'open_form')
+        open_data_entry_form(driver, user_id)
 
-        Page2_btn = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["Page2_btn_path"])
-        button_text = Page2_btn.text.strip() or Page2_btn.get_attribute('value')
-        bot_log(f"🖱️ Found button: {button_text}", user_id)
-        if not post_login_click_button(driver, Page2_btn, user_id):
-            raise Exception(f"Failed to click '{button_text}' button")
-        time.sleep(2)
+        trace_phase(user_id, 'extract_form')
+        fields = extract_form_data(driver, user_id)
 
-        Page3_btn = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["Page3_btn_path"])
-        button_text = Page3_btn.text.strip() or Page3_btn.get_attribute('value')
-        bot_log(f"🖱️ Found button: {button_text}", user_id)
-        if not post_login_click_button(driver, Page3_btn, user_id):
-            raise Exception(f"Failed to click '{button_text}' button")
-        time.sleep(2)
-
-        extract_form_data(driver, user_id)
+        if values is not None:
+            if not values:
+                values = parse_field_values(bot_input(
+                    "💬 Send the values to update, one 'Label: value' per line:", user_id))
+            if not values:
+                bot_log("⚠️ No field values received.", user_id)
+                return False
+            try:
+                trace_phase(user_id, 'fill_form')
+                results = fill_form_fields(driver, fields, values, user_id)
+                return all(result in ("ok", "unchanged") for result in results.values())
+            except Exception as e:
+                bot_log(f"❌ Error while filling form: {str(e)}", user_id)
+                return False
 
         try:
-            input_element = driver.find_element(By.XPATH,
-                                                "/html/body/form/div[4]/div/div/div/div/div/div/div[2]/div/div/div[15]/input")
+            trace_phase(user_id, 'enter_value')
+            input_element = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["value_input_path"])
+            field_id = input_element.get_attribute('id')
             bot_log("💬 Please enter a value for the input field:", user_id)
             user_value = bot_input("Enter your value:", user_id)
+            if user_value and user_value == input_element.get_attribute('value'):
+                bot_log("✅ Value already present, save skipped.", user_id)
+                return True
             if user_value:
                 input_element.clear()
                 input_element.send_keys(user_value)
@@ -530,10 +751,13 @@ def post_login_operations(user_id):
             return False
 
         try:
-            save_button = driver.find_element(By.XPATH,
-                                              "/html/body/form/div[4]/div/div/div/div/div/div/div[2]/div/div/div[19]/input")
+            trace_phase(user_id, 'save')
+            save_button = driver.find_element(By.XPATH, POST_LOGIN_XPATHS["save_btn_path"])
             save_button.click()
             bot_log("✅ Save button clicked successfully!", user_id)
+            if user_value:
+                update_form_snapshot(user_id, {label: user_value for label, field in fields.items()
+                                               if field['id'] == field_id})
             return True
         except NoSuchElementException:
             bot_log("ℹ️ Unable to find save button. The data might have been saved earlier.", user_id)
@@ -559,8 +783,7 @@ def main(user_id):
 
     finally:
         bot_input("\nPress Enter to close browser...", user_id)
-        session = session_manager.get_session(user_id)
-        session['driver'].quit()
+        session_manager.close_session(user_id)
         bot_log("Browser closed", user_id)
 
 
@@ -1,11 +1,101 @@
+import os
+import threading
+
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
 
+from user_state import user_states
+from tracing import TRACE_ENABLED
+
+# --------------------------
+# CONFIGURATION
+# --------------------------
+# BROWSER_BACKEND: headful, headless or remote
+# BROWSER_WINDOW_SIZE: "width,height" or "widthxheight"
+# BROWSER_FLAGS: extra Chrome flags, comma separated
+# BROWSER_POOL_SIZE: max concurrent drivers per process (0 = unlimited)
+# SELENIUM_REMOTE_URL: WebDriver endpoint for the remote backend, e.g. a Selenium Grid.
+#   To try it locally: `docker run -d -p 4444:4444 --shm-size=2g selenium/standalone-chrome`,
+#   then run with BROWSER_BACKEND=remote SELENIUM_REMOTE_URL=http://localhost:4444/wd/hub
+DEFAULT_FLAGS = ['--no-sandbox', '--disable-dev-shm-usage']
+POOL_WAIT_TIMEOUT = 60
+
+
+class LocalChromeBackend:
+    """Chrome on this host, visible or headless"""
+
+    def __init__(self, headless=False, window_size=(1920, 1080), flags=()):
+        self.headless = headless
+        self.window_size = window_size
+        self.flags = list(flags)
+
+    def options(self):
+        chrome_options = Options()
+        if self.headless:
+            chrome_options.add_argument('--headless')
+            chrome_options.add_argument('--disable-gpu')
+        for flag in DEFAULT_FLAGS + self.flags:
+            chrome_options.add_argument(flag)
+        chrome_options.add_argument(f'--window-size={self.window_size[0]},{self.window_size[1]}')
+        if TRACE_ENABLED:
+            # DevTools network/page events, drained into run traces (see tracing.py)
+            chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        return chrome_options
+
+    def create_driver(self):
+        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=self.options())
+        driver.set_window_size(*self.window_size)
+        return driver
+
+
+class RemoteBackend(LocalChromeBackend):
+    """Chrome behind a remote WebDriver endpoint, keeps browser load off the bot host"""
+
+    def __init__(self, url, window_size=(1920, 1080), flags=()):
+        super().__init__(headless=True, window_size=window_size, flags=flags)
+        self.url = url
+
+    def create_driver(self):
+        driver = webdriver.Remote(command_executor=self.url, options=self.options())
+        driver.set_window_size(*self.window_size)
+        return driver
+
+
+def parse_window_size(value):
+    """Parse "1920,1080" or "1920x1080" into (width, height)"""
+    parts = value.lower().replace('x', ',').split(',')
+    try:
+        width, height = (int(part) for part in parts)
+    except ValueError:
+        raise ValueError(f"Invalid BROWSER_WINDOW_SIZE '{value}', expected 'width,height' or 'widthxheight'") from None
+    return width, height
+
+
+def backend_from_env():
+    """Build the browser backend described by the BROWSER_* environment variables"""
+    name = os.getenv('BROWSER_BACKEND', 'headful').lower()
+    width, height = parse_window_size(os.getenv('BROWSER_WINDOW_SIZE', '1920,1080'))
+    flags = [flag.strip() for flag in os.getenv('BROWSER_FLAGS', '').split(',') if flag.strip()]
+
+    if name == 'headful':
+        return LocalChromeBackend(headless=False, window_size=(width, height), flags=flags)
+    if name == 'headless':
+        return LocalChromeBackend(headless=True, window_size=(width, height), flags=flags)
+    if name == 'remote':
+        url = os.getenv('SELENIUM_REMOTE_URL', 'http://localhost:4444/wd/hub')
+        return RemoteBackend(url, window_size=(width, height), flags=flags)
+    raise ValueError(f"Unknown BROWSER_BACKEND '{name}', expected headful, headless or remote")
+
 
 class SessionManager:
-    def __init__(self):
+    def __init__(self, backend=None, pool_size=None):
+        self.backend = backend or backend_from_env()
+        if pool_size is None:
+            pool_size = int(os.getenv('BROWSER_POOL_SIZE', '0'))
+        self.pool = threading.BoundedSemaphore(pool_size) if pool_size > 0 else None
+        self.lock = threading.RLock()
         self.sessions = {}
         self.busy_users = set()  # Track users who are currently in an operation
 
@@ -15,36 +105,60 @@ class SessionManager:
 
     def set_user_busy(self, user_id, busy=True):
         """Set user's busy status"""
-        if busy:
+        with self.lock:
+            if busy:
+                self.busy_users.add(user_id)
+            else:
+                self.busy_users.discard(user_id)
+
+    def try_set_busy(self, user_id):
+        """Mark the user busy unless they already are; returns False if another operation holds them"""
+        with self.lock:
+            if user_id in self.busy_users:
+                return False
             self.busy_users.add(user_id)
-        else:
-            self.busy_users.discard(user_id)
+            return True
 
     def get_session(self, user_id):
         """Get existing session or create new one"""
-        if user_id in self.sessions and self.sessions[user_id]['driver']:
-            return self.sessions[user_id]
+        with self.lock:
+            if user_id in self.sessions and self.sessions[user_id]['driver']:
+                return self.sessions[user_id]
 
-        chrome_options = Options()
-        # Removed '--headless' to make the browser visible
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
+        # Wait for a free pool slot outside the lock so closing sessions can release one
+        if self.pool and not self.pool.acquire(timeout=POOL_WAIT_TIMEOUT):
+            raise RuntimeError("No browser available right now, please try again later")
+        try:
+            driver = self.backend.create_driver()
+        except Exception:
+            if self.pool:
+                self.pool.release()
+            raise
 
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        driver.set_window_size(1920, 1080)
+        with self.lock:
+            if user_id in self.sessions and self.sessions[user_id]['driver']:
+                # Another thread won the race, keep its driver
+                self._quit(driver)
+                return self.sessions[user_id]
+            self.sessions[user_id] = {'driver': driver}
+            return self.sessions[user_id]
 
-        self.sessions[user_id] = {'driver': driver}
-        return self.sessions[user_id]
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except:
+            pass
+        if self.pool:
+            self.pool.release()
 
     def close_session(self, user_id):
         """Close and remove session"""
-        if user_id in self.sessions:
-            try:
-                self.sessions[user_id]['driver'].quit()
-            except:
-                pass
-            del self.sessions[user_id]
+        with self.lock:
+            session = self.sessions.pop(user_id, None)
+        if session:
+            self._quit(session['driver'])
         self.set_user_busy(user_id, False)  # Make sure to clear busy status
+        user_states.discard(user_id)  # Free the user's bot state along with the browser
 
     def close_all_sessions(self):
         """Close all active sessions"""
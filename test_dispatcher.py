@@ -0,0 +1,144 @@
+import types
+
+import pytest
+
+import dispatcher
+from dispatcher import WorkerPool, CRASH_MESSAGE, UNAVAILABLE_MESSAGE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeWorker:
+    def __init__(self):
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        pass
+
+    def crash(self):
+        self.alive = False
+        self.exitcode = 1
+
+
+class FakeTransport:
+    """In-memory stand-in for LocalTransport; the test plays the worker by popping inbox jobs"""
+
+    def __init__(self, num_workers):
+        self.inboxes = [[] for _ in range(num_workers)]
+        self.spawned = []
+
+    def spawn(self, index):
+        worker = FakeWorker()
+        self.spawned.append(worker)
+        return worker
+
+    def reset(self, index):
+        unread, self.inboxes[index] = self.inboxes[index], []
+        return unread
+
+    def send(self, index, job):
+        self.inboxes[index].append(job)
+
+    def receive(self, timeout=None):
+        return None
+
+
+def message(user_id, text='x'):
+    return types.SimpleNamespace(chat=types.SimpleNamespace(id=user_id), message_id=1, text=text)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(dispatcher, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def pool(clock):
+    notifications = []
+    pool = WorkerPool(num_workers=1, transport=FakeTransport(1),
+                      notify=lambda user_id, text: notifications.append((user_id, text)))
+    pool.notifications = notifications
+    # Start without the monitor/result threads, the tests drive check_workers() themselves
+    pool._spawn(0)
+    pool._running = True
+    return pool
+
+
+def crash_and_restart(pool, clock):
+    pool.workers[0].crash()
+    pool.check_workers()
+    delay = pool.restart_at[0] - clock.now if pool.restart_at[0] is not None else None
+    if delay is not None:
+        clock.now += delay
+        pool.check_workers()
+    return delay
+
+
+def test_unread_jobs_are_requeued_and_affected_users_notified(pool, clock):
+    pool.submit('login', message(1))
+    pool.transport.inboxes[0].pop(0)  # The worker took the login, then died
+    pool.submit('operations', message(2))
+
+    pool.workers[0].crash()
+    pool.check_workers()
+
+    assert [job['user_id'] for job in pool.transport.inboxes[0]] == [2]
+    assert set(pool.pending[0]) == {job['id'] for job in pool.transport.inboxes[0]}
+    assert sorted(pool.notifications) == [(1, CRASH_MESSAGE), (2, CRASH_MESSAGE)]
+
+
+def test_restart_waits_for_backoff(pool, clock):
+    pool.workers[0].crash()
+    pool.check_workers()
+    assert len(pool.transport.spawned) == 1
+
+    clock.now += dispatcher.RESTART_BACKOFF - 1
+    pool.check_workers()
+    assert len(pool.transport.spawned) == 1
+
+    clock.now += 1
+    pool.check_workers()
+    assert len(pool.transport.spawned) == 2
+    assert pool.workers[0].is_alive()
+
+
+def test_restart_delay_doubles_after_each_crash(pool, clock):
+    delays = [crash_and_restart(pool, clock) for _ in range(3)]
+    assert delays == [dispatcher.RESTART_BACKOFF * 2 ** attempt for attempt in range(3)]
+
+
+def test_stable_worker_resets_backoff(pool, clock):
+    crash_and_restart(pool, clock)
+    clock.now += dispatcher.STABLE_UPTIME
+    assert crash_and_restart(pool, clock) == dispatcher.RESTART_BACKOFF
+
+
+def test_worker_given_up_after_max_restarts(pool, clock):
+    for _ in range(dispatcher.MAX_RESTARTS):
+        assert crash_and_restart(pool, clock) is not None
+    pool.submit('login', message(3))
+
+    assert crash_and_restart(pool, clock) is None
+    assert pool.given_up[0]
+    assert len(pool.transport.spawned) == dispatcher.MAX_RESTARTS + 1
+    assert (3, UNAVAILABLE_MESSAGE) in pool.notifications
+
+    pool.notifications.clear()
+    pool.submit('login', message(4))
+    assert pool.transport.inboxes[0] == []
+    assert pool.notifications == [(4, UNAVAILABLE_MESSAGE)]
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+import user_state
+from user_state import UserStateStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(user_state, 'time', clock)
+    return clock
+
+
+def test_expired_states_are_evicted(clock):
+    store = UserStateStore(ttl=60, max_users=100)
+    store.get_or_create(1)
+    clock.now += 30
+    store.get_or_create(2)
+    clock.now += 31
+
+    store.get_or_create(3)
+
+    assert list(store.states) == [2, 3]
+
+
+def test_access_refreshes_ttl(clock):
+    store = UserStateStore(ttl=60, max_users=100)
+    store.get_or_create(1)
+    clock.now += 50
+    store.get(1)
+    clock.now += 50
+
+    store.get_or_create(2)
+
+    assert list(store.states) == [1, 2]
+
+
+def test_size_bound_drops_least_recently_used(clock):
+    store = UserStateStore(ttl=60, max_users=3)
+    for user_id in range(3):
+        store.get_or_create(user_id)
+    store.get(0)
+
+    store.get_or_create(3)
+
+    assert list(store.states) == [2, 0, 3]
+
+
+def test_user_waiting_on_prompt_is_never_evicted(clock):
+    store = UserStateStore(ttl=60, max_users=2)
+    store.get_or_create(1).waiting_input = True
+    clock.now += 120
+
+    store.get_or_create(2)
+    store.get_or_create(3)
+
+    assert 1 in store.states
+    assert len(store) == 2
+    assert store.submit_input(1, 'answer')
+    assert store.get(1).input_value == 'answer'
+
+
+def test_new_state_survives_when_everyone_else_is_waiting(clock):
+    store = UserStateStore(ttl=60, max_users=1)
+    store.get_or_create(1).waiting_input = True
+
+    state = store.get_or_create(2)
+
+    assert store.get(2) is state
+
+
+class FakeBot:
+    def __init__(self):
+        self.deleted = []
+
+    def delete_message(self, chat_id, message_id):
+        self.deleted.append((chat_id, message_id))
+
+
+def test_discard_releases_pending_prompt_and_clears_status():
+    store = UserStateStore(ttl=60, max_users=10)
+    state = store.get_or_create(1)
+    state.bot = FakeBot()
+    state.last_message_id = 42
+    state.waiting_input = True
+
+    def wait_for_input():
+        while state.waiting_input:
+            time.sleep(0.01)
+
+    waiter = threading.Thread(target=wait_for_input)
+    waiter.start()
+
+    store.discard(1)
+
+    waiter.join(timeout=1)
+    assert not waiter.is_alive()
+    assert state.bot.deleted == [(1, 42)]
+    assert store.get(1) is None
+    assert not store.submit_input(1, 'late answer')
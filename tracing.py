@@ -0,0 +1,331 @@
+"""
+Opt-in per-run trace recorder for offline profiling.
+
+Set TRACE_RUNS=1 to record every login/operations run to TRACE_DIR as a gzipped
+JSON file (the newest TRACE_MAX_FILES are kept). Each trace holds phase events,
+WebDriver command counts and latency per phase, time spent waiting for the user
+to reply, navigation timing and the Chrome DevTools network log. Summaries and
+comparisons leave the user wait out of our own time.
+
+    python tracing.py summarize traces/<file>.json.gz
+    python tracing.py compare traces/<before>.json.gz traces/<after>.json.gz
+"""
+import argparse
+import functools
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+
+# --------------------------
+# CONFIGURATION
+# --------------------------
+TRACE_ENABLED = os.getenv('TRACE_RUNS') == '1'
+TRACE_DIR = os.getenv('TRACE_DIR', 'traces')
+TRACE_MAX_FILES = int(os.getenv('TRACE_MAX_FILES', '200'))
+
+# DevTools events kept from the performance log, everything else is dropped
+NETWORK_EVENTS = {
+    'Network.requestWillBeSent',
+    'Network.responseReceived',
+    'Network.loadingFinished',
+    'Network.loadingFailed',
+    'Page.domContentEventFired',
+    'Page.loadEventFired',
+}
+
+NAVIGATION_SCRIPT = """
+const entry = performance.getEntriesByType('navigation')[0];
+return [performance.timeOrigin, entry ? entry.toJSON() : null];
+"""
+
+_active = {}
+_active_lock = threading.Lock()
+
+
+class TraceRecorder:
+    """Records one run: phases, WebDriver commands, navigation timing and network events"""
+
+    def __init__(self, user_id, run):
+        self.user_id = user_id
+        self.run = run
+        self.started_at = time.time()
+        self.start = time.monotonic()
+        self.driver = None
+        self.phases = []
+        self.navigation = []
+        self.network = []
+        self._time_origin = None
+        self.phase('start')
+
+    def attach(self, driver):
+        """Start counting WebDriver commands; every command goes through driver.execute"""
+        if self.driver is driver:
+            return
+        self.detach()
+        self.driver = driver
+        original = driver.execute
+
+        def execute(command, params=None):
+            began = time.monotonic()
+            try:
+                return original(command, params)
+            finally:
+                phase = self.phases[-1]
+                elapsed = time.monotonic() - began
+                count, total = phase['by_command'].get(command, (0, 0.0))
+                phase['by_command'][command] = (count + 1, total + elapsed)
+                phase['commands'] += 1
+                phase['command_time'] += elapsed
+
+        driver.execute = execute
+
+    def detach(self):
+        if self.driver is not None:
+            self.driver.__dict__.pop('execute', None)  # Back to the class method, uncounted
+            self.driver = None
+
+    def phase(self, name):
+        """Close the current phase and open a new one; collection overhead falls between the two"""
+        if self.phases:
+            self.phases[-1]['duration'] = time.monotonic() - self.start - self.phases[-1]['start']
+            self._collect_browser_data()
+        now = time.monotonic() - self.start
+        self.phases.append({'name': name, 'start': now, 'duration': 0.0,
+                            'commands': 0, 'command_time': 0.0, 'wait_time': 0.0, 'by_command': {}})
+
+    def add_wait(self, seconds):
+        """Count time spent waiting for the user against the current phase"""
+        self.phases[-1]['wait_time'] += seconds
+
+    def _collect_browser_data(self):
+        """Drain the performance log and capture navigation timing, without counting the commands"""
+        if self.driver is None:
+            return
+        driver = self.driver
+        execute = driver.__dict__.pop('execute', None)
+        try:
+            time_origin, entry = driver.execute_script(NAVIGATION_SCRIPT)
+            if entry and time_origin != self._time_origin:
+                self._time_origin = time_origin
+                self.navigation.append({'phase': self.phases[-1]['name'], 'entry': entry})
+            for record in driver.get_log('performance'):
+                self._add_network_event(json.loads(record['message'])['message'])
+        except Exception:
+            pass  # Performance logging not enabled, or the browser went away
+        finally:
+            if execute:
+                driver.execute = execute
+
+    def _add_network_event(self, message):
+        method = message.get('method')
+        if method not in NETWORK_EVENTS:
+            return
+        params = message.get('params', {})
+        event = [round(params.get('timestamp', 0.0), 6), method, params.get('requestId')]
+        if method == 'Network.requestWillBeSent':
+            event.append(params.get('request', {}).get('url'))
+        elif method == 'Network.responseReceived':
+            event.append(params.get('response', {}).get('status'))
+        elif method == 'Network.loadingFinished':
+            event.append(params.get('encodedDataLength'))
+        elif method == 'Network.loadingFailed':
+            event.append(params.get('errorText'))
+        self.network.append(event)
+
+    def finish(self, status):
+        """Close the last phase and write the trace"""
+        self.phase('end')
+        self.detach()
+        for phase in self.phases:
+            phase['by_command'] = {command: [count, round(total, 6)]
+                                   for command, (count, total) in phase['by_command'].items()}
+        trace = {
+            'run': self.run,
+            'user_id': self.user_id,
+            'started_at': self.started_at,
+            'duration': time.monotonic() - self.start,
+            'status': status,
+            'phases': self.phases[:-1],
+            'navigation': self.navigation,
+            'network': self.network,
+        }
+        return write_trace(trace)
+
+
+def write_trace(trace):
+    """Write a trace as gzipped compact JSON and drop the oldest files beyond TRACE_MAX_FILES"""
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(trace['started_at']))
+    path = os.path.join(TRACE_DIR, f"{stamp}-{int(trace['started_at'] * 1000) % 1000:03d}"
+                                   f"-{trace['user_id']}-{trace['run']}.json.gz")
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(trace, f, separators=(',', ':'))
+
+    files = sorted(glob.glob(os.path.join(TRACE_DIR, '*.json.gz')))
+    for old in files[:-TRACE_MAX_FILES]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
+
+
+def load_trace(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# --------------------------
+# HOOKS USED BY ds.py
+# --------------------------
+def traced(run):
+    """Decorator recording a run of func(user_id, ...) when TRACE_RUNS=1"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(user_id, *args, **kwargs):
+            if not TRACE_ENABLED:
+                return func(user_id, *args, **kwargs)
+            recorder = TraceRecorder(user_id, run)
+            with _active_lock:
+                _active[user_id] = recorder
+            status = 'error'
+            try:
+                result = func(user_id, *args, **kwargs)
+                status = 'ok' if result else 'failed'
+                return result
+            finally:
+                with _active_lock:
+                    _active.pop(user_id, None)
+                try:
+                    recorder.finish(status)
+                except Exception as e:
+                    print(f"Failed to write trace: {e}")
+        return wrapper
+    return decorator
+
+
+def trace_driver(user_id, driver):
+    """Count the driver's commands in the user's active trace, if any"""
+    recorder = _active.get(user_id)
+    if recorder:
+        recorder.attach(driver)
+
+
+def trace_phase(user_id, name):
+    """Mark the start of a phase in the user's active trace, if any"""
+    recorder = _active.get(user_id)
+    if recorder:
+        recorder.phase(name)
+
+
+def trace_wait(user_id, seconds):
+    """Record time spent waiting on the user (bot_input) in the user's active trace, if any"""
+    recorder = _active.get(user_id)
+    if recorder:
+        recorder.add_wait(seconds)
+
+
+# --------------------------
+# CLI
+# --------------------------
+def network_requests(trace):
+    """Pair network events into [(url, start, duration, status, bytes)] sorted by start"""
+    requests = {}
+    for timestamp, method, request_id, *detail in trace['network']:
+        if method == 'Network.requestWillBeSent':
+            requests[request_id] = {'url': detail[0], 'start': timestamp, 'end': None, 'status': None, 'bytes': 0}
+        elif request_id in requests:
+            request = requests[request_id]
+            if method == 'Network.responseReceived':
+                request['status'] = detail[0]
+            elif method == 'Network.loadingFinished':
+                request['end'], request['bytes'] = timestamp, detail[0] or 0
+            elif method == 'Network.loadingFailed':
+                request['end'], request['status'] = timestamp, detail[0]
+    return sorted(((r['url'], r['start'], (r['end'] - r['start']) if r['end'] else None, r['status'], r['bytes'])
+                   for r in requests.values()), key=lambda r: r[1])
+
+
+def summarize(trace):
+    lines = [f"{trace['run']} for {trace['user_id']}: {trace['status']} in {trace['duration'] * 1000:.0f} ms",
+             "",
+             f"{'phase':<24}{'wall ms':>10}{'cmds':>7}{'driver ms':>11}{'user ms':>10}{'other ms':>10}"]
+    for phase in trace['phases']:
+        wall, driver = phase['duration'] * 1000, phase['command_time'] * 1000
+        wait = phase.get('wait_time', 0.0) * 1000
+        lines.append(f"{phase['name']:<24}{wall:>10.0f}{phase['commands']:>7}{driver:>11.0f}"
+                     f"{wait:>10.0f}{wall - driver - wait:>10.0f}")
+
+    if trace['navigation']:
+        lines += ["", f"{'navigation':<48}{'ttfb ms':>9}{'dcl ms':>9}{'load ms':>9}"]
+        for navigation in trace['navigation']:
+            entry = navigation['entry']
+            lines.append(f"{entry['name'][:47]:<48}{entry['responseStart'] - entry['requestStart']:>9.0f}"
+                         f"{entry['domContentLoadedEventEnd']:>9.0f}{entry['loadEventEnd']:>9.0f}")
+
+    requests = network_requests(trace)
+    if requests:
+        total_bytes = sum(request[4] for request in requests)
+        lines += ["", f"{len(requests)} requests, {total_bytes / 1024:.0f} KiB, slowest:"]
+        for url, _, duration, status, _ in sorted(requests, key=lambda r: r[2] or 0, reverse=True)[:5]:
+            lines.append(f"  {(duration or 0) * 1000:>7.0f} ms  {status}  {url[:80]}")
+    return "\n".join(lines)
+
+
+def phase_totals(trace):
+    """
+    Sum time excluding user waits, and driver time, per phase name;
+    phases like enter_credentials repeat in a run
+    """
+    totals = {}
+    for phase in trace['phases']:
+        total = totals.setdefault(phase['name'], {'duration': 0.0, 'command_time': 0.0})
+        total['duration'] += phase['duration'] - phase.get('wait_time', 0.0)
+        total['command_time'] += phase['command_time']
+    return totals
+
+
+def active_duration(trace):
+    """Run duration without the time spent waiting for the user"""
+    return trace['duration'] - sum(phase.get('wait_time', 0.0) for phase in trace['phases'])
+
+
+def compare(before, after):
+    """Per-phase deltas; user waits are left out so they can't mask or fake a regression"""
+    lines = [f"{'phase':<24}{'before ms':>11}{'after ms':>10}{'delta ms':>10}{'driver delta':>14}"]
+    before_phases, after_phases = phase_totals(before), phase_totals(after)
+    names = list(before_phases) + [name for name in after_phases if name not in before_phases]
+    empty = {'duration': 0.0, 'command_time': 0.0}
+    for name in names:
+        old, new = before_phases.get(name, empty), after_phases.get(name, empty)
+        delta = (new['duration'] - old['duration']) * 1000
+        driver_delta = (new['command_time'] - old['command_time']) * 1000
+        lines.append(f"{name:<24}{old['duration'] * 1000:>11.0f}{new['duration'] * 1000:>10.0f}"
+                     f"{delta:>+10.0f}{driver_delta:>+14.0f}")
+    before_total, after_total = active_duration(before), active_duration(after)
+    lines.append(f"{'total':<24}{before_total * 1000:>11.0f}{after_total * 1000:>10.0f}"
+                 f"{(after_total - before_total) * 1000:>+10.0f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize or compare run traces")
+    commands = parser.add_subparsers(dest='command', required=True)
+    summarize_parser = commands.add_parser('summarize', help="Show phase timings and network for traces")
+    summarize_parser.add_argument('paths', nargs='+')
+    compare_parser = commands.add_parser('compare', help="Show per-phase deltas between two traces")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    args = parser.parse_args()
+
+    if args.command == 'summarize':
+        print("\n\n".join(summarize(load_trace(path)) for path in args.paths))
+    else:
+        print(compare(load_trace(args.before), load_trace(args.after)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --------------------------
+# CONFIGURATION
+# --------------------------
+# USER_STATE_TTL: seconds of inactivity before a user's state is dropped
+# USER_STATE_MAX: max users kept in memory, least recently used go first
+DEFAULT_TTL = int(os.getenv('USER_STATE_TTL', '3600'))
+DEFAULT_MAX_USERS = int(os.getenv('USER_STATE_MAX', '10000'))
+
+
+class UserState:
+    """Everything the bot keeps about one chat"""
+    __slots__ = ('bot', 'chat_id', 'waiting_input', 'input_value', 'last_message_id', 'last_seen')
+
+    def __init__(self, chat_id):
+        self.bot = None
+        self.chat_id = chat_id
+        self.waiting_input = False
+        self.input_value = None
+        self.last_message_id = None
+        self.last_seen = time.monotonic()
+
+
+class UserStateStore:
+    """Bounded, thread-safe map of user id to UserState with TTL eviction"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_users=DEFAULT_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.lock = threading.Lock()
+        self.states = OrderedDict()  # Least recently used first
+
+    def get(self, user_id):
+        """Return the user's state or None, marking it as recently used"""
+        with self.lock:
+            state = self.states.get(user_id)
+            if state:
+                self._touch(user_id, state)
+            return state
+
+    def get_or_create(self, user_id):
+        """Return the user's state, creating it if needed"""
+        with self.lock:
+            state = self.states.get(user_id)
+            if state:
+                self._touch(user_id, state)
+                return state
+            state = self.states[user_id] = UserState(user_id)
+            self._evict()
+            return state
+
+    def submit_input(self, user_id, text):
+        """Hand text to a pending bot_input prompt, returns False if nothing was waiting"""
+        with self.lock:
+            state = self.states.get(user_id)
+            if not state or not state.waiting_input:
+                return False
+            state.input_value = text
+            state.waiting_input = False
+            self._touch(user_id, state)
+            return True
+
+    def discard(self, user_id):
+        """Forget everything about a user, releasing a pending prompt and clearing the status message"""
+        with self.lock:
+            state = self.states.pop(user_id, None)
+        if not state:
+            return
+        state.waiting_input = False  # bot_input returns at once instead of waiting out its timeout
+        if state.bot and state.last_message_id is not None:
+            try:
+                state.bot.delete_message(state.chat_id, state.last_message_id)
+            except:
+                pass  # Ignore if message already deleted
+            state.last_message_id = None
+
+    def __len__(self):
+        return len(self.states)
+
+    def _touch(self, user_id, state):
+        state.last_seen = time.monotonic()
+        self.states.move_to_end(user_id)
+
+    def _evict(self):
+        """Drop expired states, then the oldest ones beyond max_users; never a user mid-prompt"""
+        cutoff = time.monotonic() - self.ttl
+        newest = next(reversed(self.states), None)
+        while self.states:
+            user_id = next(iter(self.states))  # Oldest first, so this usually stops at once
+            state = self.states[user_id]
+            if user_id == newest:
+                break
+            if state.last_seen >= cutoff and len(self.states) <= self.max_users:
+                break  # Everything after this is newer
+            if state.waiting_input:
+                self._touch(user_id, state)  # Mid-prompt counts as in use, it moves behind `newest`
+            else:
+                del self.states[user_id]
+
+
+user_states = UserStateStore()
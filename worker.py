@@ -0,0 +1,152 @@
+import logging
+import os
+import threading
+
+import telebot
+
+import ds
+from session_manager import session_manager
+from user_state import user_states
+
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGE = "⚠️ session is already active. Please wait for the current operation to complete or use /logout to reset."
+
+
+def reply(bot, job, text):
+    """Reply to the message that triggered the job"""
+    bot.send_message(job['user_id'], text, reply_to_message_id=job['message_id'])
+
+
+# Start job
+def handle_start(bot, job):
+    user_id = job['user_id']
+    if not session_manager.try_set_busy(user_id):
+        reply(bot, job, BUSY_MESSAGE)
+        return
+
+    try:
+        ds.clear_status(user_id)  # Clear any existing status
+        ds.set_bot_instance(bot, user_id)
+        session_manager.get_session(user_id)
+        reply(bot, job, '👋 Welcome! I\'m ready to help you. Use /login to begin.')
+    finally:
+        session_manager.set_user_busy(user_id, False)
+
+
+# Login job
+def handle_login(bot, job):
+    user_id = job['user_id']
+    if not session_manager.try_set_busy(user_id):
+        reply(bot, job, BUSY_MESSAGE)
+        return
+
+    try:
+        ds.clear_status(user_id)  # Clear any existing status
+        ds.set_bot_instance(bot, user_id)
+        success = ds.handle_login_attempt(user_id)
+        if not success:
+            session_manager.close_session(user_id)
+    except Exception as e:
+        reply(bot, job, f"❌ Error during login: {str(e)}")
+        session_manager.close_session(user_id)
+    finally:
+        session_manager.set_user_busy(user_id, False)
+
+
+# Logout job
+def handle_logout(bot, job):
+    user_id = job['user_id']
+    ds.clear_status(user_id)  # Clear any existing status
+    session_manager.close_session(user_id)
+    reply(bot, job, '👋 Logged out successfully.')
+
+
+# Operations job
+def handle_operations(bot, job):
+    user_id = job['user_id']
+    if not session_manager.try_set_busy(user_id):
+        reply(bot, job, BUSY_MESSAGE)
+        return
+
+    try:
+        ds.clear_status(user_id)  # Clear any existing status
+        ds.set_bot_instance(bot, user_id)
+        ds.post_login_operations(user_id)
+    except Exception as e:
+        reply(bot, job, f"❌ Error during operations: {str(e)}")
+    finally:
+        session_manager.set_user_busy(user_id, False)
+
+
+# Fill job, "/fill" followed by optional "Label: value" lines, the first may share the command line
+def handle_fill(bot, job):
+    user_id = job['user_id']
+    if not session_manager.try_set_busy(user_id):
+        reply(bot, job, BUSY_MESSAGE)
+        return
+
+    try:
+        # Values in the message (on the command line or below it) win over the user's batch file;
+        # with neither the user is asked once
+        values = ds.parse_field_values(''.join((job['text'] or '').split(None, 1)[1:]))
+        if not values:
+            values = ds.load_form_values(user_id)
+            if values:
+                reply(bot, job, f"📂 No values in your message, using your {len(values)} saved value(s) from form_values.json")
+
+        ds.clear_status(user_id)  # Clear any existing status
+        ds.set_bot_instance(bot, user_id)
+        ds.post_login_operations(user_id, values=values)
+    except Exception as e:
+        reply(bot, job, f"❌ Error during operations: {str(e)}")
+    finally:
+        session_manager.set_user_busy(user_id, False)
+
+
+# Free text, answers a pending bot_input prompt
+def handle_input(bot, job):
+    user_id = job['user_id']
+    if user_states.submit_input(user_id, job['text']):
+        reply(bot, job, '✅ Input received!')
+
+
+JOB_HANDLERS = {
+    'start': handle_start,
+    'login': handle_login,
+    'logout': handle_logout,
+    'operations': handle_operations,
+    'fill': handle_fill,
+    'input': handle_input,
+}
+
+
+def run_job(index, bot, job, outbox):
+    """Run a job and report the outcome to the front end"""
+    error = None
+    try:
+        JOB_HANDLERS[job['kind']](bot, job)
+    except Exception as e:
+        logger.exception(f"Job '{job['kind']}' failed for {job['user_id']}")
+        error = str(e)
+    outbox.put({'worker': index, 'id': job['id'], 'kind': job['kind'], 'user_id': job['user_id'],
+                'error': error})
+
+
+def main(index, inbox, outbox):
+    """Worker process loop; jobs run on their own threads so input can reach a waiting login"""
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Worker {index} started (pid {os.getpid()})")
+    bot = telebot.TeleBot(os.getenv('TELEGRAM_BOT_TOKEN'))
+    try:
+        while True:
+            job = inbox.get()
+            if job is None:
+                break
+            if job['kind'] == 'input':
+                run_job(index, bot, job, outbox)
+            else:
+                threading.Thread(target=run_job, args=(index, bot, job, outbox), daemon=True).start()
+    finally:
+        session_manager.close_all_sessions()
+        logger.info(f"Worker {index} stopped")